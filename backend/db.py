@@ -1,95 +1,186 @@
 import os
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure
+import logging
+import time
+import functools
+from typing import Optional
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import BulkWriteError, ConnectionFailure
 from bson.objectid import ObjectId
-from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Pipeline que devuelve las tareas ya listas para el frontend:
+# ordenadas por fecha de creación, '_id' como string, 'created_at' como string ISO
+# y 'status' siempre válido.
+TASKS_PIPELINE = [
+    {"$sort": {"created_at": -1}}, # Más recientes primero, usando el índice de created_at
+    {"$addFields": {
+        "status": {"$cond": [
+            {"$in": ["$status", ["pending", "completed", "in_progress", "cancelled"]]},
+            "$status",
+            "pending"
+        ]},
+        "_id": {"$toString": "$_id"},
+        # Solo se convierten las fechas BSON; valores ya en texto (ISO) se dejan tal cual
+        "created_at": {"$cond": [
+            {"$eq": [{"$type": "$created_at"}, "date"]},
+            {"$dateToString": {"date": "$created_at"}},
+            "$created_at"
+        ]}
+    }}
+]
+
+# Conversión memoizada de IDs hexadecimales a ObjectId (los ObjectId son inmutables)
+_oid_cache = functools.lru_cache(maxsize=4096)(ObjectId)
+
+# Segundos durante los que se reutiliza el listado de tareas en memoria.
+# La caché es local a cada proceso: con varios workers se desactiva (TASKS_CACHE_TTL=0).
+TASKS_CACHE_TTL = float(os.getenv("TASKS_CACHE_TTL", "5"))
 
 class MongoDBManager:
     def __init__(self):
         """
         Initializes the MongoDBManager by setting the MongoDB URI, client, and database attributes.
-        Attempts to establish a connection to the MongoDB server using the provided URI or defaults to a local instance.
+        The connection itself is established by the async connect() method, which must be awaited
+        from the application's startup event.
         """
         self.mongo_uri = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
+        # Tamaño del pool por proceso; con varios workers el total es workers * max_pool_size
+        self.max_pool_size = int(os.getenv("MONGO_MAX_POOL_SIZE", "200"))
+        self.min_pool_size = int(os.getenv("MONGO_MIN_POOL_SIZE", "10"))
         self.client = None
         self.db = None
-        self.connect()
+        # Caché en memoria del listado de tareas, invalidada en cada escritura
+        self._tasks_cache: Optional[list] = None
+        self._cache_ts: float = 0.0
+        # Generación de escrituras: una lectura solo rellena la caché si no hubo escrituras mientras se ejecutaba
+        self._write_generation: int = 0
 
-    def connect(self):
+    async def connect(self):
         """Establece la conexión con la base de datos MongoDB."""
         try:
-            self.client = MongoClient(self.mongo_uri)
+            # Pool explícito: conexiones calientes reutilizadas entre peticiones
+            self.client = AsyncIOMotorClient(
+                self.mongo_uri,
+                maxPoolSize=self.max_pool_size,
+                minPoolSize=self.min_pool_size,
+                maxIdleTimeMS=300_000,
+                waitQueueTimeoutMS=2500,
+                serverSelectionTimeoutMS=2000,
+                retryWrites=True
+            )
             # Intenta una operación para verificar la conexión
-            self.client.admin.command('ping')
+            await self.client.admin.command('ping')
             self.db = self.client.task_manager_db # Nombre de la base de datos
-            print("Conexión a MongoDB establecida con éxito.")
+            logger.info("Conexión a MongoDB establecida con éxito.")
+            await self._ensure_indexes()
+            pool_options = self.client.options.pool_options
+            logger.info(
+                "Pool de MongoDB: maxPoolSize=%s, minPoolSize=%s, maxIdleTime=%ss, waitQueueTimeout=%ss",
+                pool_options.max_pool_size,
+                pool_options.min_pool_size,
+                pool_options.max_idle_time_seconds,
+                pool_options.wait_queue_timeout
+            )
         except ConnectionFailure as e:
-            print(f"Error al conectar a MongoDB: {e}")
+            logger.error("Error al conectar a MongoDB: %s", e)
             raise
 
+    async def _ensure_indexes(self):
+        """
+        Crea los índices para ordenar y filtrar tareas (create_index es idempotente).
+        Un fallo aquí (p. ej. sin privilegio createIndex) no invalida la conexión.
+        """
+        try:
+            await self.db.tasks.create_index([("created_at", -1)])
+            await self.db.tasks.create_index([("status", 1), ("created_at", -1)])
+        except Exception as e:
+            logger.warning("No se pudieron crear los índices de tareas: %s", e)
+
     def close_connection(self):
         """Cierra la conexión con la base de datos MongoDB."""
         if self.client:
             self.client.close()
-            print("Conexión a MongoDB cerrada.")
+            logger.info("Conexión a MongoDB cerrada.")
+
+    def _invalidate_tasks_cache(self):
+        """Descarta el listado de tareas en caché tras una escritura."""
+        self._write_generation += 1
+        self._tasks_cache = None
 
-    def add_task(self, description: str, start_date: str = None, status: str = "pending") -> str:
-        """Añade una nueva tarea a la base de datos."""
+    async def add_task(self, description: str, start_date: str = None, status: str = "pending") -> str:
+        """
+        Añade una nueva tarea a la base de datos.
+        La fecha de creación la asigna el servidor de MongoDB mediante $currentDate.
+        """
         if self.db is None:
-            print("Error: No hay conexión a la base de datos.")
+            logger.error("No hay conexión a la base de datos.")
             return None
         
         task_data = {
             "description": description,
-            "created_at": datetime.now(),
             "status": status
         }
         if start_date:
             task_data["start_date"] = start_date
 
         try:
-            result = self.db.tasks.insert_one(task_data)
-            return str(result.inserted_id)
-        except Exception as e:
-            print(f"Error al añadir tarea: {e}")
+            result = await self.db.tasks.update_one(
+                {"_id": ObjectId()},
+                {"$set": task_data, "$currentDate": {"created_at": True}},
+                upsert=True
+            )
+            self._invalidate_tasks_cache()
+            return str(result.upserted_id)
+        except Exception:
+            logger.exception("Error al añadir tarea")
             return None
 
-    def get_all_tasks(self) -> list:
+    async def get_all_tasks(self) -> list:
         """
         Recupera todas las tareas de la base de datos.
         Asegura que el campo 'status' siempre sea válido.
+        La normalización se realiza en el propio pipeline de agregación de MongoDB
+        y el resultado se reutiliza durante TASKS_CACHE_TTL segundos.
         """
         if self.db is None:
-            print("Error: No hay conexión a la base de datos.")
+            logger.error("No hay conexión a la base de datos.")
             return []
 
-        tasks = []
-        valid_statuses = {"pending", "completed", "in_progress", "cancelled"}
+        if self._tasks_cache is not None and time.monotonic() - self._cache_ts < TASKS_CACHE_TTL:
+            return self._tasks_cache
+
+        generation = self._write_generation
         try:
-            for task_doc in self.db.tasks.find():
-                # Convertir ObjectId a string para el frontend
-                task_doc["_id"] = str(task_doc["_id"])
-                
-                # Validar y corregir el campo 'status'
-                current_status = task_doc.get("status")
-                if current_status not in valid_statuses:
-                    print(f"Advertencia: Tarea con ID {task_doc['_id']} tiene un estado inválido '{current_status}'. Estableciendo a 'pending'.")
-                    task_doc["status"] = "pending" # Establecer un valor por defecto válido
-                
-                # Asegurar que created_at sea un string ISO si no lo es
-                if isinstance(task_doc.get("created_at"), datetime):
-                    task_doc["created_at"] = task_doc["created_at"].isoformat()
-                
-                tasks.append(task_doc)
+            cursor = self.db.tasks.aggregate(TASKS_PIPELINE, batchSize=500)
+            tasks = [task_doc async for task_doc in cursor]
+            if TASKS_CACHE_TTL > 0 and generation == self._write_generation:
+                self._tasks_cache = tasks
+                self._cache_ts = time.monotonic()
             return tasks
-        except Exception as e:
-            print(f"Error al obtener todas las tareas: {e}")
+        except Exception:
+            logger.exception("Error al obtener todas las tareas")
             return []
 
-    def update_task(self, task_id: str, description: str = None, start_date: str = None, status: str = None) -> bool:
+    async def iter_tasks(self):
+        """
+        Recorre las tareas una a una directamente desde el cursor de MongoDB,
+        sin materializar la colección completa en memoria.
+        """
+        if self.db is None:
+            logger.error("No hay conexión a la base de datos.")
+            return
+
+        try:
+            async for task_doc in self.db.tasks.aggregate(TASKS_PIPELINE, batchSize=200):
+                yield task_doc
+        except Exception:
+            logger.exception("Error al recorrer las tareas")
+
+    async def update_task(self, task_id: str, description: str = None, start_date: str = None, status: str = None) -> bool:
         """Actualiza una tarea existente por su ID."""
         if self.db is None:
-            print("Error: No hay conexión a la base de datos.")
+            logger.error("No hay conexión a la base de datos.")
             return False
 
         update_fields = {}
@@ -102,31 +193,55 @@ class MongoDBManager:
             if status in valid_statuses:
                 update_fields["status"] = status
             else:
-                print(f"Advertencia: Intento de actualizar tarea {task_id} con estado inválido '{status}'. Ignorando el cambio de estado.")
+                logger.warning("Intento de actualizar tarea %s con estado inválido '%s'. Ignorando el cambio de estado.", task_id, status)
                 return False 
 
         if not update_fields:
             return False # No hay campos para actualizar
 
         try:
-            result = self.db.tasks.update_one(
-                {"_id": ObjectId(task_id)},
+            result = await self.db.tasks.update_one(
+                {"_id": _oid_cache(task_id)},
                 {"$set": update_fields}
             )
+            self._invalidate_tasks_cache()
             return result.modified_count > 0
-        except Exception as e:
-            print(f"Error al actualizar tarea {task_id}: {e}")
+        except Exception:
+            logger.exception("Error al actualizar tarea %s", task_id)
             return False
 
-    def delete_task(self, task_id: str) -> bool:
+    async def delete_task(self, task_id: str) -> bool:
         """Elimina una tarea por su ID."""
         if self.db is None:
-            print("Error: No hay conexión a la base de datos.")
+            logger.error("No hay conexión a la base de datos.")
             return False
         try:
-            result = self.db.tasks.delete_one({"_id": ObjectId(task_id)})
+            result = await self.db.tasks.delete_one({"_id": _oid_cache(task_id)})
+            self._invalidate_tasks_cache()
             return result.deleted_count > 0
-        except Exception as e:
-            print(f"Error al eliminar tarea {task_id}: {e}")
+        except Exception:
+            logger.exception("Error al eliminar tarea %s", task_id)
             return False
 
+    async def bulk_update_tasks(self, ops: list) -> int:
+        """
+        Aplica en una sola operación una lista de escrituras (UpdateOne / DeleteOne) sobre las tareas.
+        Devuelve el número de tareas modificadas o eliminadas.
+        """
+        if self.db is None:
+            logger.error("No hay conexión a la base de datos.")
+            return 0
+        if not ops:
+            return 0
+        try:
+            result = await self.db.tasks.bulk_write(ops, ordered=False)
+            self._invalidate_tasks_cache()
+            return result.modified_count + result.deleted_count
+        except BulkWriteError as e:
+            # Con ordered=False el resto de operaciones sí se aplicó
+            self._invalidate_tasks_cache()
+            logger.error("Errores en escrituras en bloque: %s", e.details.get("writeErrors"))
+            return e.details["nModified"] + e.details["nRemoved"]
+        except Exception:
+            logger.exception("Error al aplicar escrituras en bloque")
+            return 0
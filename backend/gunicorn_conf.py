@@ -0,0 +1,39 @@
+"""
+Configuración de gunicorn para producción.
+
+Uso (desde la carpeta backend):
+    gunicorn -c gunicorn_conf.py main:app
+"""
+import multiprocessing
+import os
+
+from uvicorn.workers import UvicornWorker
+
+
+class UvloopWorker(UvicornWorker):
+    """Worker de uvicorn que fija uvloop como event loop y httptools como parser HTTP."""
+    CONFIG_KWARGS = {"loop": "uvloop", "http": "httptools"}
+
+
+bind = os.getenv("BIND", "0.0.0.0:5000")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+worker_class = "gunicorn_conf.UvloopWorker"
+
+# Sin preload: cada worker importa la app después del fork (y después de post_fork), de modo que
+# el cliente de MongoDB (creado en el evento de arranque) y el cliente HTTP del LLM son propios de cada proceso.
+preload_app = False
+
+
+def post_fork(server, worker):
+    """
+    Ajusta el entorno de cada worker recién creado, antes de que importe la app.
+    Usa server.cfg.workers, así que también respeta un -w pasado por línea de comandos.
+    """
+    num_workers = server.cfg.workers
+    if num_workers > 1:
+        # La caché de /tasks es local a cada proceso y solo la invalida una escritura en ese
+        # mismo worker: con varios workers se desactiva para no servir listados obsoletos.
+        os.environ["TASKS_CACHE_TTL"] = "0"
+        # El pool de MongoDB es por worker: se reparte el presupuesto total de conexiones.
+        os.environ.setdefault("MONGO_MAX_POOL_SIZE", str(max(10, 200 // num_workers)))
+        os.environ.setdefault("MONGO_MIN_POOL_SIZE", str(max(1, 10 // num_workers)))
@@ -1,13 +1,18 @@
 import os
-import json
+import logging
+import orjson
 import re
+import hashlib
+import string
 import httpx
+from cachetools import TTLCache
 from datetime import datetime
 from dotenv import load_dotenv
 
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
 from typing import List, Optional, Literal, Dict, Any
 from bson.objectid import ObjectId
 from pymongo.errors import ConnectionFailure
@@ -15,6 +20,16 @@ from pymongo.errors import ConnectionFailure
 # Cargar variables de entorno desde el archivo .env
 load_dotenv()
 
+# En producción basta con WARNING; LOG_LEVEL=DEBUG activa la traza detallada del LLM
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING").upper())
+logger = logging.getLogger(__name__)
+# httpx/httpcore registran cada petición con su URL completa; se limitan a WARNING
+logging.getLogger("httpx").setLevel(logging.WARNING)
+logging.getLogger("httpcore").setLevel(logging.WARNING)
+
+# Extrae el JSON de un bloque markdown ```json ... ``` en la respuesta del LLM
+_JSON_BLOCK_RE = re.compile(r'```json\s*(.*?)\s*```', re.DOTALL)
+
 # --- Modelos Pydantic para validación de datos y documentación ---
 
 class TaskBase(BaseModel):
@@ -38,13 +53,11 @@ class Task(TaskBase):
     id: str = Field(..., alias="_id") # Mapea _id de MongoDB a 'id' en la respuesta JSON
     created_at: datetime
 
-    class Config:
-        """Configuración para Pydantic."""
-        allow_population_by_field_name = True # Permite que Pydantic use el alias '_id'
-        json_encoders = {
-            ObjectId: lambda oid: str(oid),
-            datetime: lambda dt: dt.isoformat() # Convertir datetime a string ISO
-        }
+    model_config = ConfigDict(populate_by_name=True) # Permite que Pydantic use el alias '_id'
+
+class CommandIn(BaseModel):
+    """Modelo del cuerpo de la petición a /command."""
+    command: str = Field(..., min_length=1)
 
 # --- Modelo para la salida estructurada del LLM (nuestro MCP) ---
 
@@ -52,6 +65,8 @@ class LLMCommand(BaseModel):
     """
     Define el esquema de JSON que esperamos del LLM.
     """
+    model_config = ConfigDict(extra="ignore") # Las claves desconocidas del LLM se descartan
+
     action: Literal["create", "read", "update", "delete", "unknown"]
     task_id: Optional[str] = None
     description: Optional[str] = None
@@ -65,6 +80,7 @@ app = FastAPI(
     title="API de Gestión de Tareas con MongoDB, FastAPI y MCP",
     description="Una API RESTful que interpreta comandos de texto para gestionar tareas, usando un LLM.",
     version="1.0.0",
+    default_response_class=ORJSONResponse, # Serialización de respuestas con orjson
 )
 
 # Configuración de CORS para permitir que el frontend de React se conecte
@@ -81,133 +97,178 @@ app.add_middleware(
     allow_headers=["*"], # Permite todas las cabeceras
 )
 
-# Importar y inicializar MongoDBManager de forma segura
+# El MongoDBManager se inicializa de forma segura en el evento de arranque
 db_manager = None
-try:
-    from db import MongoDBManager
-    db_manager = MongoDBManager()
-except ConnectionFailure as e:
-    print(f"CRITICAL ERROR: No se pudo conectar a MongoDB al iniciar la aplicación: {e}")
-    print("La aplicación se iniciará, pero las operaciones de base de datos no funcionarán.")
-except Exception as e:
-    print(f"CRITICAL ERROR: Error inesperado al inicializar MongoDBManager: {e}")
-    print("La aplicación se iniciará, pero las operaciones de base de datos no funcionarán.")
+from db import MongoDBManager
+
+@app.on_event("startup")
+async def startup_event():
+    """Abre la conexión asíncrona a MongoDB al arrancar la aplicación."""
+    global db_manager
+    manager = MongoDBManager()
+    try:
+        await manager.connect()
+        db_manager = manager
+    except ConnectionFailure as e:
+        manager.close_connection() # Libera el cliente y sus hilos de monitorización
+        logger.critical("No se pudo conectar a MongoDB al iniciar la aplicación: %s", e)
+        logger.critical("La aplicación se iniciará, pero las operaciones de base de datos no funcionarán.")
+    except Exception:
+        manager.close_connection()
+        logger.exception("Error inesperado al inicializar MongoDBManager")
+        logger.critical("La aplicación se iniciará, pero las operaciones de base de datos no funcionarán.")
 
 # --- Funciones de interacción con el LLM ---
 
+GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
+
+# Cliente HTTP compartido: reutiliza la conexión TLS (HTTP/2 + keepalive) con la API de Gemini
+llm_client = httpx.AsyncClient(
+    http2=True,
+    timeout=httpx.Timeout(30.0, connect=5.0),
+    limits=httpx.Limits(max_keepalive_connections=32, max_connections=64)
+)
+
+# Define el JSON Schema que el LLM debe seguir para su respuesta
+RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "action": {
+            "type": "STRING",
+            "enum": ["create", "read", "update", "delete", "unknown"],
+            "description": "The action to perform on tasks."
+        },
+        "task_id": {
+            "type": "STRING",
+            "description": "ID of the task for update or delete actions. Required for update/delete."
+        },
+        "description": {
+            "type": "STRING",
+            "description": "Description of the task. Required for create, optional for update."
+        },
+        "start_date": {
+            "type": "STRING",
+            "format": "date-time",
+            "description": "Start date of the task in McClellan-MM-DD format. Optional for create/update."
+        },
+        "status": {
+            "type": "STRING",
+            "enum": ["pending", "completed", "in_progress", "cancelled"],
+            "description": "Status of the task. Optional for create/update."
+        },
+        "message": {
+            "type": "STRING",
+            "description": "A user-friendly message if the action is 'unknown' or needs clarification."
+        }
+    },
+    "required": ["action"],
+    "propertyOrdering": ["action", "task_id", "description", "start_date", "status", "message"]
+}
+
+PROMPT_TEMPLATE_LINES = [
+    "Eres un asistente de gestión de tareas. Tu objetivo es interpretar los comandos del usuario y devolver UN OBJETO JSON que represente la acción y los datos de la tarea. NO INCLUYAS NINGÚN TEXTO ADICIONAL FUERA DEL JSON.",
+    "Las fechas deben estar en formato McClellan-MM-DD.",
+    "Los estados posibles de las tareas son: \"pending\", \"completed\", \"in_progress\", \"cancelled\".",
+    "",
+    "Si no puedes determinar una acción clara, usa \"unknown\" para la acción y proporciona un mensaje útil en el campo \"message\".",
+    "",
+    "Ejemplos:",
+    "Comando de usuario: 'crear la tarea \"realizar app\" con fecha de inicio 03-07-2025 y estado \"pendiente\"'",
+    "JSON esperado:",
+    "```json",
+    "{",
+    "  \"action\": \"create\",",
+    "  \"description\": \"realizar app\",",
+    "  \"start_date\": \"2025-07-03\",",
+    "  \"status\": \"pending\"",
+    "}",
+    "```",
+    "",
+    "Comando de usuario: 'marcar tarea 60c7b41b1d7d8f9c7b4c3e21 como completada'",
+    "JSON esperado:",
+    "```json",
+    "{",
+    "  \"action\": \"update\",",
+    "  \"task_id\": \"60c7b41b1d7d8f9c7b4c3e21\",",
+    "  \"status\": \"completed\"",
+    "}",
+    "```",
+    "",
+    "Comando de usuario: 'actualizar la descripción de la tarea 60c7b41b1d7d8f9c7b4c3e21 a \"Terminar informe\"'",
+    "JSON esperado:",
+    "```json",
+    "{",
+    "  \"action\": \"update\",",
+    "  \"task_id\": \"60c7b41b1d7d8f9c7b4c3e21\",",
+    "  \"description\": \"Terminar informe\"",
+    "}",
+    "```",
+    "",
+    "Comando de usuario: 'eliminar tarea 60c7b41b1d7d8f9c7b4c3e21'",
+    "JSON esperado:",
+    "```json",
+    "{",
+    "  \"action\": \"delete\",",
+    "  \"task_id\": \"60c7b41b1d7d8f9c7b4c3e21\"",
+    "}",
+    "```",
+    "",
+    "Comando de usuario: 'mostrar todas mis tareas'",
+    "JSON esperado:",
+    "```json",
+    "{",
+    "  \"action\": \"read\"",
+    "}",
+    "```",
+    "",
+    "Comando de usuario: '¿Qué tiempo hace hoy?'",
+    "JSON esperado:",
+    "```json",
+    "{",
+    "  \"action\": \"unknown\",",
+    "  \"message\": \"Lo siento, solo puedo gestionar tareas. ¿Hay algo que pueda hacer con tus tareas?\"",
+    "}",
+    "```",
+    "",
+    "Comando de usuario: '$user_prompt'" # Este es el único marcador de posición para substitute()
+]
+# Plantilla precompilada una sola vez; string.Template evita escapar las llaves del JSON
+PROMPT_TEMPLATE = string.Template("\n".join(PROMPT_TEMPLATE_LINES))
+
+# Caché de interpretaciones del LLM para comandos repetidos (clave: hash del prompt normalizado)
+llm_command_cache = TTLCache(maxsize=2048, ttl=600)
+
+# Acciones que dependen del estado de las tareas y no se reutilizan desde la caché
+UNCACHEABLE_ACTIONS = {"create", "update", "delete"}
+
+def _llm_cache_key(user_prompt: str) -> str:
+    """Calcula la clave de caché a partir del comando normalizado."""
+    return hashlib.blake2b(user_prompt.strip().lower().encode(), digest_size=16).hexdigest()
+
+# Intenciones frecuentes que se resuelven localmente, sin llamar al LLM
+_READ_INTENT_RE = re.compile(r'^\s*(?:mostrar|listar|ver|list)\s+(?:todas\s+)?(?:mis\s+|las\s+)?tareas?\s*[.!]?\s*$', re.I)
+_DELETE_INTENT_RE = re.compile(r'^\s*(?:eliminar|borrar|delete)\s+(?:la\s+)?(?:tarea\s+|task\s+)?([0-9a-f]{24})\s*$', re.I)
+
+def _fast_intent(user_input: str) -> Optional[LLMCommand]:
+    """Interpreta sin LLM los comandos triviales de lectura y borrado; devuelve None si no aplica."""
+    if _READ_INTENT_RE.match(user_input):
+        return LLMCommand(action="read")
+    delete_match = _DELETE_INTENT_RE.match(user_input)
+    if delete_match:
+        return LLMCommand(action="delete", task_id=delete_match.group(1))
+    return None
+
 async def call_llm_for_command(user_prompt: str) -> LLMCommand:
     """
     Llama al LLM para interpretar el comando del usuario y devolver un JSON estructurado.
+    Los comandos repetidos se responden desde la caché sin volver a llamar al LLM.
     """
-    # Define el JSON Schema que el LLM debe seguir para su respuesta
-    response_schema = {
-        "type": "OBJECT",
-        "properties": {
-            "action": {
-                "type": "STRING",
-                "enum": ["create", "read", "update", "delete", "unknown"],
-                "description": "The action to perform on tasks."
-            },
-            "task_id": {
-                "type": "STRING",
-                "description": "ID of the task for update or delete actions. Required for update/delete."
-            },
-            "description": {
-                "type": "STRING",
-                "description": "Description of the task. Required for create, optional for update."
-            },
-            "start_date": {
-                "type": "STRING",
-                "format": "date-time",
-                "description": "Start date of the task in McClellan-MM-DD format. Optional for create/update."
-            },
-            "status": {
-                "type": "STRING",
-                "enum": ["pending", "completed", "in_progress", "cancelled"],
-                "description": "Status of the task. Optional for create/update."
-            },
-            "message": {
-                "type": "STRING",
-                "description": "A user-friendly message if the action is 'unknown' or needs clarification."
-            }
-        },
-        "required": ["action"],
-        "propertyOrdering": ["action", "task_id", "description", "start_date", "status", "message"]
-    }
+    cache_key = _llm_cache_key(user_prompt)
+    cached_command = llm_command_cache.get(cache_key)
+    if cached_command is not None:
+        return LLMCommand(**cached_command)
 
-    prompt_template_lines = [
-        "Eres un asistente de gestión de tareas. Tu objetivo es interpretar los comandos del usuario y devolver UN OBJETO JSON que represente la acción y los datos de la tarea. NO INCLUYAS NINGÚN TEXTO ADICIONAL FUERA DEL JSON.",
-        "Las fechas deben estar en formato McClellan-MM-DD.",
-        "Los estados posibles de las tareas son: \"pending\", \"completed\", \"in_progress\", \"cancelled\".",
-        "",
-        "Si no puedes determinar una acción clara, usa \"unknown\" para la acción y proporciona un mensaje útil en el campo \"message\".",
-        "",
-        "Ejemplos:",
-        "Comando de usuario: 'crear la tarea \"realizar app\" con fecha de inicio 03-07-2025 y estado \"pendiente\"'",
-        "JSON esperado:",
-        "```json",
-        "{{",
-        "  \"action\": \"create\",",
-        "  \"description\": \"realizar app\",",
-        "  \"start_date\": \"2025-07-03\",",
-        "  \"status\": \"pending\"",
-        "}}",
-        "```",
-        "",
-        "Comando de usuario: 'marcar tarea 60c7b41b1d7d8f9c7b4c3e21 como completada'",
-        "JSON esperado:",
-        "```json",
-        "{{",
-        "  \"action\": \"update\",",
-        "  \"task_id\": \"60c7b41b1d7d8f9c7b4c3e21\",",
-        "  \"status\": \"completed\"",
-        "}}",
-        "```",
-        "",
-        "Comando de usuario: 'actualizar la descripción de la tarea 60c7b41b1d7d8f9c7b4c3e21 a \"Terminar informe\"'",
-        "JSON esperado:",
-        "```json",
-        "{{",
-        "  \"action\": \"update\",",
-        "  \"task_id\": \"60c7b41b1d7d8f9c7b4c3e21\",",
-        "  \"description\": \"Terminar informe\"",
-        "}}",
-        "```",
-        "",
-        "Comando de usuario: 'eliminar tarea 60c7b41b1d7d8f9c7b4c3e21'",
-        "JSON esperado:",
-        "```json",
-        "{{",
-        "  \"action\": \"delete\",",
-        "  \"task_id\": \"60c7b41b1d7d8f9c7b4c3e21\"",
-        "}}",
-        "```",
-        "",
-        "Comando de usuario: 'mostrar todas mis tareas'",
-        "JSON esperado:",
-        "```json",
-        "{{",
-        "  \"action\": \"read\"",
-        "}}",
-        "```",
-        "",
-        "Comando de usuario: '¿Qué tiempo hace hoy?'",
-        "JSON esperado:",
-        "```json",
-        "{{",
-        "  \"action\": \"unknown\",",
-        "  \"message\": \"Lo siento, solo puedo gestionar tareas. ¿Hay algo que pueda hacer con tus tareas?\"",
-        "}}",
-        "```",
-        "",
-        "Comando de usuario: '{user_prompt}'" # Este es el único marcador de posición para format()
-    ]
-    prompt_template = "\n".join(prompt_template_lines)
-
-    print(f"DEBUG: Prompt template ANTES de format: \n{repr(prompt_template)}") # Depuración
-    
-    formatted_prompt = prompt_template.format(user_prompt=user_prompt)
-    print(f"DEBUG: Prompt template DESPUÉS de format: \n{repr(formatted_prompt)}") # Depuración
+    formatted_prompt = PROMPT_TEMPLATE.substitute(user_prompt=user_prompt)
 
     chat_history = []
     chat_history.append({ "role": "user", "parts": [{ "text": formatted_prompt }] })
@@ -216,80 +277,75 @@ async def call_llm_for_command(user_prompt: str) -> LLMCommand:
         "contents": chat_history,
         "generationConfig": {
             "responseMimeType": "application/json",
-            "responseSchema": response_schema
+            "responseSchema": RESPONSE_SCHEMA
         }
     }
 
     api_key = os.getenv("GEMINI_API_KEY", "") 
     if not api_key:
-        print("ERROR: La clave API de Gemini no se encontró en las variables de entorno. Asegúrate de tenerla en tu archivo .env como GEMINI_API_KEY.")
+        logger.error("La clave API de Gemini no se encontró en las variables de entorno. Asegúrate de tenerla en tu archivo .env como GEMINI_API_KEY.")
         return LLMCommand(action="unknown", message="Error de configuración: Clave API no encontrada.")
 
-    api_url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={api_key}"
-
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                api_url,
-                headers={'Content-Type': 'application/json'},
-                json=payload
-            )
-            response.raise_for_status() # Lanza una excepción para errores HTTP (4xx o 5xx)
-            result = response.json()
-
-            print(f"DEBUG: Respuesta cruda del LLM: {result}") # Depuración: ver la respuesta completa
-
-            if result.get("candidates") and len(result["candidates"]) > 0 and \
-               result["candidates"][0].get("content") and \
-               result["candidates"][0]["content"].get("parts") and \
-               len(result["candidates"][0]["content"]["parts"]) > 0:
-                
-                raw_text = result["candidates"][0]["content"]["parts"][0]["text"]
-                print(f"DEBUG: Texto extraído del LLM: '{raw_text}' (repr: {repr(raw_text)})") # Depuración: ver el texto antes de parsear
-
-                json_string_to_parse = ""
-                json_block_match = re.search(r'```json\s*(.*?)\s*```', raw_text, re.DOTALL)
-                
+        response = await llm_client.post(
+            GEMINI_API_URL,
+            headers={'Content-Type': 'application/json', 'x-goog-api-key': api_key}, # Clave fuera de la URL
+            content=orjson.dumps(payload)
+        )
+        response.raise_for_status() # Lanza una excepción para errores HTTP (4xx o 5xx)
+        result = orjson.loads(response.content)
+
+        logger.debug("Respuesta cruda del LLM: %s", result)
+
+        if result.get("candidates") and len(result["candidates"]) > 0 and \
+           result["candidates"][0].get("content") and \
+           result["candidates"][0]["content"].get("parts") and \
+           len(result["candidates"][0]["content"]["parts"]) > 0:
+            
+            raw_text = result["candidates"][0]["content"]["parts"][0]["text"]
+            logger.debug("Texto extraído del LLM: %r", raw_text)
+
+            # Con responseMimeType JSON la respuesta suele ser JSON puro; el regex es solo el respaldo
+            json_string_to_parse = raw_text.strip()
+            if json_string_to_parse.startswith("{"):
+                logger.debug("JSON directo del texto crudo: '%s'", json_string_to_parse)
+            else:
+                json_block_match = _JSON_BLOCK_RE.search(raw_text)
                 if json_block_match:
                     json_string_to_parse = json_block_match.group(1).strip()
-                    print(f"DEBUG: JSON extraído de bloque markdown: '{json_string_to_parse}'") # Depuración
-                else:
-                    json_string_to_parse = raw_text.strip()
-                    print(f"DEBUG: JSON directo del texto crudo: '{json_string_to_parse}'") # Depuración
-
-                try:
-                    parsed_json = json.loads(json_string_to_parse)
-                    print(f"DEBUG: JSON parseado: {parsed_json}") # Depuración
-
-                    clean_parsed_json = {}
-                    for k, v in parsed_json.items():
-                        cleaned_key = re.sub(r'[^\w]', '', k).strip() 
-                        print(f"DEBUG: Original key: '{k}' (repr: {repr(k)}) -> Cleaned key: '{cleaned_key}' (repr: {repr(cleaned_key)})")
-                        clean_parsed_json[cleaned_key] = v
-                    
-                    print(f"DEBUG: JSON con claves limpias: {clean_parsed_json}") # Depuración
-                    
-                    action_value = clean_parsed_json.get('action')
-                    if action_value is None:
-                        print(f"Advertencia: La clave 'action' no se encontró después de parsear y limpiar. JSON original: '{raw_text}', JSON limpio: {clean_parsed_json}")
-                        return LLMCommand(action="unknown", message="No pude determinar la acción del LLM. Por favor, sé más específico.")
-
-                    if action_value not in ["create", "read", "update", "delete", "unknown"]:
-                         print(f"Advertencia: El valor de 'action' '{action_value}' no es válido. JSON limpio: {clean_parsed_json}")
-                         return LLMCommand(action="unknown", message=f"La acción '{action_value}' no es válida. Por favor, sé más específico.")
-
-                    return LLMCommand(**clean_parsed_json) # Validar con el modelo Pydantic
-                except json.JSONDecodeError as e:
-                    print(f"ERROR: Error al decodificar JSON del LLM: {e}. String intentado parsear: '{json_string_to_parse}' (repr: {repr(json_string_to_parse)})")
+                    logger.debug("JSON extraído de bloque markdown: '%s'", json_string_to_parse)
+
+            try:
+                # pydantic-core valida directamente desde el texto JSON, sin un dict intermedio
+                llm_response = LLMCommand.model_validate_json(json_string_to_parse)
+            except ValidationError as e:
+                errors = e.errors()
+                if errors[0]["type"] == "json_invalid":
+                    logger.error("Error al decodificar JSON del LLM. String intentado parsear: %r", json_string_to_parse)
                     return LLMCommand(action="unknown", message="El LLM devolvió un formato JSON inválido. Inténtalo de nuevo.")
-            else:
-                print(f"ERROR: Respuesta inesperada del LLM (no candidates/content): {result}")
-                return LLMCommand(action="unknown", message="No pude interpretar tu comando. Inténtalo de nuevo.")
+
+                action_error = next((err for err in errors if err["loc"] == ("action",)), None)
+                if action_error is not None and (action_error["type"] == "missing" or action_error["input"] is None):
+                    logger.warning("La clave 'action' no se encontró después de parsear. JSON original: '%s'", raw_text)
+                    return LLMCommand(action="unknown", message="No pude determinar la acción del LLM. Por favor, sé más específico.")
+                if action_error is not None:
+                    action_value = action_error["input"]
+                    logger.warning("El valor de 'action' '%s' no es válido. JSON original: '%s'", action_value, raw_text)
+                    return LLMCommand(action="unknown", message=f"La acción '{action_value}' no es válida. Por favor, sé más específico.")
+                raise
+
+            logger.debug("Comando validado: %s", llm_response)
+            if llm_response.action not in UNCACHEABLE_ACTIONS:
+                llm_command_cache[cache_key] = llm_response.model_dump()
+            return llm_response
+        else:
+            logger.error("Respuesta inesperada del LLM (no candidates/content): %s", result)
+            return LLMCommand(action="unknown", message="No pude interpretar tu comando. Inténtalo de nuevo.")
     except httpx.HTTPStatusError as e:
-        print(f"ERROR HTTP al llamar al LLM: {e.response.status_code} - {e.response.text}")
+        logger.error("Error HTTP al llamar al LLM: %s - %s", e.response.status_code, e.response.text)
         return LLMCommand(action="unknown", message=f"Error del servidor al procesar tu comando: {e.response.status_code}.")
-    except Exception as e: # Captura cualquier otro error inesperado
-        print(f"ERROR general al llamar al LLM: {e}")
+    except Exception: # Captura cualquier otro error inesperado
+        logger.exception("Error general al llamar al LLM")
         return LLMCommand(action="unknown", message="Ocurrió un error inesperado al procesar tu comando.")
 
 
@@ -301,19 +357,21 @@ async def read_root():
     return {"message": "¡Bienvenido a la API de Gestión de Tareas con FastAPI y MCP!"}
 
 @app.post("/command", response_model=Dict[str, Any])
-async def process_command(request: Request):
+async def process_command(body: CommandIn):
     """
     Endpoint principal para procesar comandos de texto del usuario.
     El LLM interpreta el comando y realiza la acción correspondiente en la DB.
     """
-    data = await request.json()
-    user_input = data.get('command')
+    user_input = body.command
 
-    if not user_input:
-        raise HTTPException(status_code=400, detail="El campo 'command' es requerido.")
+    # 1. Interpretar el comando localmente si es trivial; si no, llamar al LLM
+    llm_response: Optional[LLMCommand] = _fast_intent(user_input)
+    if llm_response is None:
+        llm_response = await call_llm_for_command(user_input)
 
-    # 1. Llamar al LLM para interpretar el comando
-    llm_response: LLMCommand = await call_llm_for_command(user_input)
+    # Rechazar IDs mal formados antes de llegar a la base de datos
+    if llm_response.action in ("update", "delete") and llm_response.task_id and not ObjectId.is_valid(llm_response.task_id):
+        raise HTTPException(status_code=400, detail=f"El ID de tarea '{llm_response.task_id}' no es válido.")
 
     # 2. Ejecutar la acción basada en la interpretación del LLM
     action_result = {"status": "success", "message": "Comando procesado."}
@@ -325,7 +383,7 @@ async def process_command(request: Request):
         if not llm_response.description:
             action_result = {"status": "error", "message": "Para crear una tarea, necesito una descripción."}
         else:
-            task_id = db_manager.add_task(
+            task_id = await db_manager.add_task(
                 description=llm_response.description,
                 start_date=llm_response.start_date,
                 status=llm_response.status
@@ -344,7 +402,7 @@ async def process_command(request: Request):
         elif not (llm_response.description or llm_response.start_date or llm_response.status):
             action_result = {"status": "error", "message": "Para actualizar, necesito al menos una descripción, fecha o estado."}
         else:
-            success = db_manager.update_task(
+            success = await db_manager.update_task(
                 task_id=llm_response.task_id,
                 description=llm_response.description,
                 start_date=llm_response.start_date,
@@ -359,7 +417,7 @@ async def process_command(request: Request):
         if not llm_response.task_id:
             action_result = {"status": "error", "message": "Para eliminar una tarea, necesito el ID de la tarea."}
         else:
-            success = db_manager.delete_task(llm_response.task_id)
+            success = await db_manager.delete_task(llm_response.task_id)
             if success:
                 action_result["message"] = f"Tarea {llm_response.task_id} eliminada correctamente."
             else:
@@ -371,7 +429,7 @@ async def process_command(request: Request):
     else:
         action_result = {"status": "error", "message": "Acción no reconocida por el sistema."}
 
-    return {"llm_interpretation": llm_response.dict(), "action_result": action_result}
+    return {"llm_interpretation": llm_response.model_dump(), "action_result": action_result}
 
 @app.get("/tasks", response_model=List[Task])
 async def get_tasks():
@@ -382,13 +440,29 @@ async def get_tasks():
     # Asegurarse de que db_manager está inicializado antes de usarlo
     if db_manager is None:
         raise HTTPException(status_code=500, detail="Error de base de datos: Conexión no establecida.")
-    tasks = db_manager.get_all_tasks()
+    tasks = await db_manager.get_all_tasks()
     return tasks
 
+@app.get("/tasks.ndjson")
+async def stream_tasks():
+    """
+    Endpoint para obtener todas las tareas como NDJSON (una tarea JSON por línea).
+    Las tareas se envían a medida que llegan del cursor de MongoDB.
+    """
+    if db_manager is None:
+        raise HTTPException(status_code=500, detail="Error de base de datos: Conexión no establecida.")
+
+    async def ndjson_lines():
+        async for task_doc in db_manager.iter_tasks():
+            yield orjson.dumps(task_doc) + b"\n"
+
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
 # Para cerrar la conexión a MongoDB cuando la aplicación se detiene
 @app.on_event("shutdown")
 async def shutdown_event():
-    """Cierra la conexión a MongoDB al apagar la aplicación."""
+    """Cierra la conexión a MongoDB y el cliente HTTP del LLM al apagar la aplicación."""
     if db_manager:
         db_manager.close_connection()
+    await llm_client.aclose()
 